@@ -1,13 +1,21 @@
 import os 
+import re
 import time
-import json
 import logging
+import queue
+import threading
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from flask import Flask, render_template, jsonify
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
-from collections import deque
-from typing import Optional, Tuple
+from datetime import datetime, timedelta
+from collections import OrderedDict, deque
+from functools import lru_cache, wraps
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 # === Logging ===
@@ -17,6 +25,12 @@ logger = logging.getLogger(__name__)
 # === Flask App ===
 app = Flask(__name__)
 
+# === Scheduler ===
+# Scans run on the scheduler's worker threads so HTTP handlers never block on them.
+scheduler = BackgroundScheduler()
+# Manual triggers reschedule this one job, so max_instances=1 keeps every scan serialized.
+SCAN_JOB_ID = "scan"
+
 # === Environment Variables ===
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 telegram_chat_ids_str = os.getenv("TELEGRAM_CHAT_IDS")
@@ -31,133 +45,438 @@ DEFAULT_TICKERS = [
     "NVDA", "TSLA", "AAPL", "AMZN", "PLTR", "AMD", "SMCI", "HIMS", "F", "LCID",
     "UPST", "RIVN", "MSFT", "BAC", "SOFI", "NU", "HOOD", "MARA", "PLUG", "QBTS"
 ]
+# TICKERS is an immutable tuple: replace the binding to change it, never mutate in place,
+# so a concurrent scan sees either the old or the new list and its cached pattern.
 tickers_str = os.getenv("MONITORED_TICKERS")
 if tickers_str:
-    TICKERS = [ticker.strip() for ticker in tickers_str.split(",") if ticker.strip()]
+    # Symbols are matched case-sensitively, so normalise to upper case and drop repeats once here.
+    TICKERS = tuple(dict.fromkeys(ticker.strip().upper() for ticker in tickers_str.split(",") if ticker.strip()))
 else:
-    TICKERS = DEFAULT_TICKERS
+    TICKERS = tuple(DEFAULT_TICKERS)
+
+# === Ticker Matching ===
+@lru_cache(maxsize=4)
+def compile_ticker_pattern(tickers: Tuple[str, ...]) -> re.Pattern:
+    return re.compile(r"\b(" + "|".join(map(re.escape, tickers)) + r")\b")
+
+def match_tickers(text: str) -> list:
+    """Return monitored tickers mentioned as whole words, in order of first mention."""
+    tickers = TICKERS  # read the binding once so a concurrent swap cannot split this call
+    if not tickers:
+        return []
+    pattern = compile_ticker_pattern(tuple(tickers))  # no copy: tuple(t) is t
+    return list(dict.fromkeys(pattern.findall(text)))
 
 # === Alert Cache ===
-sent_hashes = deque(maxlen=100)
+# Insertion-ordered so the oldest fingerprint is evicted first; membership is O(1).
+SENT_HASHES_MAX = 100
+sent_hashes: "OrderedDict[int, None]" = OrderedDict()
+sent_hashes_lock = threading.Lock()
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+def article_fingerprint(article: dict) -> int:
+    """Dedup key that ignores case, punctuation and whitespace so mirrored copies of a story collide."""
+    text = article.get('title') or article.get('description') or ''
+    return hash(_NON_WORD_RE.sub(" ", text.lower()).strip())
+
+def is_duplicate_and_mark(key: int) -> bool:
+    with sent_hashes_lock:
+        if key in sent_hashes:
+            return True
+        sent_hashes[key] = None
+        if len(sent_hashes) > SENT_HASHES_MAX:
+            sent_hashes.popitem(last=False)
+        return False
+
 analyzer = SentimentIntensityAnalyzer()
 
+# === Worker Pool for outbound HTTP ===
+EXECUTOR = ThreadPoolExecutor(max_workers=16)
+
+# === Shared HTTP Session (keep-alive + connection pooling) ===
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0))
+SESSION.headers.update({"Accept-Encoding": "gzip"})
+HTTP_TIMEOUT = 10
+
+def parse_json(response: requests.Response):
+    """Decode a response body with orjson, which is several times faster than the stdlib parser."""
+    return orjson.loads(response.content)
+
+# === Rate Limiting ===
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# Telegram allows roughly 30 messages per second per bot.
+telegram_rate_limiter = TokenBucket(rate=30, capacity=30)
+
 # === Telegram Alerts ===
+TELEGRAM_MESSAGE_LIMIT = 4096
+ALERT_SEPARATOR = "\n\n---\n\n"
+# Longest Retry-After we sleep for; the wait blocks a shared EXECUTOR worker.
+TELEGRAM_RETRY_AFTER_MAX = 30
+_MARKDOWN_SPECIAL_RE = re.compile(r"([_*`\[])")
+
+def escape_markdown(text: str) -> str:
+    """Escape Telegram Markdown entity characters so untrusted text cannot break a message."""
+    return _MARKDOWN_SPECIAL_RE.sub(r"\\\1", text)
+
+def _is_retryable_telegram_error(error: BaseException) -> bool:
+    """Retry throttling, server errors and network failures; 4xx responses are permanent."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+_telegram_backoff = wait_exponential(min=1, max=8)
+
+def _telegram_wait(retry_state) -> float:
+    """Honour Telegram's Retry-After on 429 responses (capped), otherwise back off exponentially."""
+    response = getattr(retry_state.outcome.exception(), "response", None)
+    if response is not None and response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), TELEGRAM_RETRY_AFTER_MAX)
+    return _telegram_backoff(retry_state)
+
+@retry(stop=stop_after_attempt(3), wait=_telegram_wait,
+       retry=retry_if_exception(_is_retryable_telegram_error), reraise=True)
+def _post_telegram_message(url: str, chat_id: str, message: str):
+    telegram_rate_limiter.acquire()
+    data = {"chat_id": chat_id.strip(), "text": message, "parse_mode": "Markdown"}
+    r = SESSION.post(url, data=data, timeout=HTTP_TIMEOUT)
+    r.raise_for_status()
+
 def send_telegram_alert(message: str):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_IDS:
         logger.warning("Telegram not configured.")
         return
+    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    futures = {chat_id.strip(): EXECUTOR.submit(_post_telegram_message, url, chat_id, message)
+               for chat_id in TELEGRAM_CHAT_IDS}
+    # Wait on every chat so one failure never hides the others.
+    for chat_id, future in futures.items():
+        try:
+            future.result()
+            logger.info(f"✅ Sent alert to Telegram chat {chat_id}.")
+        except Exception as e:
+            logger.error(f"Telegram alert failed for chat {chat_id}: {e}")
+
+def batch_messages(messages: list, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Pack messages into as few Telegram-sized texts as possible.
+
+    Messages are kept whole; only a single message longer than `limit` is truncated.
+    """
+    batches = []
+    current = ""
+    for message in messages:
+        message = message[:limit]
+        candidate = f"{current}{ALERT_SEPARATOR}{message}" if current else message
+        if current and len(candidate) > limit:
+            batches.append(current)
+            candidate = message
+        current = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+# Scans hand messages to a background sender so Telegram latency and retries never stall them.
+telegram_queue: "queue.Queue[str]" = queue.Queue(maxsize=1024)
+
+def queue_telegram_alert(message: str):
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        for chat_id in TELEGRAM_CHAT_IDS:
-            data = {"chat_id": chat_id.strip(), "text": message[:4096], "parse_mode": "Markdown"}
-            r = requests.post(url, data=data)
-            r.raise_for_status()
-        logger.info("✅ Sent alert to Telegram.")
-    except Exception as e:
-        logger.error(f"Telegram alert failed: {e}")
+        telegram_queue.put_nowait(message)
+    except queue.Full:
+        logger.error("Telegram queue full, dropping alert.")
+
+def send_next_queued_alert():
+    """Block until a message is queued, then send it."""
+    message = telegram_queue.get()
+    try:
+        send_telegram_alert(message)
+    finally:
+        telegram_queue.task_done()
+
+def telegram_sender_loop():
+    while True:
+        send_next_queued_alert()
+
+# === Response Caching ===
+def ttl_cache(ttl: float, maxsize: int = 256, should_cache: Callable = lambda value: value is not None):
+    """Memoise a single-argument function for `ttl` seconds, evicting the oldest entry beyond `maxsize`."""
+    def decorator(func):
+        cache: "OrderedDict" = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(key):
+            now = time.monotonic()
+            # Single-key dict reads are atomic under the GIL; only the multi-step update below needs the lock.
+            hit = cache.get(key)
+            if hit is not None and now - hit[0] < ttl:
+                return hit[1]
+            value = func(key)
+            if should_cache(value):
+                with lock:
+                    cache[key] = (now, value)
+                    cache.move_to_end(key)
+                    if len(cache) > maxsize:
+                        cache.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
+
+# Quotes move every second; option snapshots (strike ladder + asks) are refreshed less often.
+PRICE_CACHE_TTL = 30
+OPTION_CACHE_TTL = 60
 
 # === Polygon Price ===
+@ttl_cache(ttl=PRICE_CACHE_TTL)
 def get_price_polygon(ticker: str) -> Optional[float]:
     try:
         url = f"https://api.polygon.io/v2/last/nbbo/{ticker}?apiKey={POLYGON_API_KEY}"
-        r = requests.get(url)
+        r = SESSION.get(url, timeout=HTTP_TIMEOUT)
         r.raise_for_status()
-        data = r.json()
+        data = parse_json(r)
         return float(data.get("results", {}).get("bid", 0))
     except Exception as e:
         logger.error(f"Polygon price error: {e}")
         return None
 
 # === Polygon Options ===
+def select_atm_option(options: list) -> Tuple[Optional[float], Optional[float]]:
+    """Pick the quoted call whose strike is closest to the underlying price in a single pass.
+
+    Falls back to the first contract when the snapshot carries no underlying price, and
+    returns (None, None) when it does but no call has a strike and an ask.
+    """
+    underlying = options[0].get("underlying_asset", {}).get("price")
+    best, best_distance = options[0], float("inf")
+    if underlying is not None:
+        best = None
+        for option in options:
+            details = option.get("details", {})
+            strike = details.get("strike_price")
+            if strike is None or details.get("contract_type", "call") != "call":
+                continue
+            if option.get("last_quote", {}).get("ask") is None:
+                continue
+            distance = abs(strike - underlying)
+            if distance < best_distance:
+                best, best_distance = option, distance
+        if best is None:
+            return None, None
+    return best.get("details", {}).get("strike_price"), best.get("last_quote", {}).get("ask")
+
+@ttl_cache(ttl=OPTION_CACHE_TTL, should_cache=lambda value: None not in value)
 def get_option_data_polygon(ticker: str) -> Tuple[Optional[float], Optional[float]]:
     try:
-        url = f"https://api.polygon.io/v3/snapshot/options/{ticker}?apiKey={POLYGON_API_KEY}"
-        r = requests.get(url)
+        url = f"https://api.polygon.io/v3/snapshot/options/{ticker}?contract_type=call&limit=250&apiKey={POLYGON_API_KEY}"
+        r = SESSION.get(url, timeout=HTTP_TIMEOUT)
         r.raise_for_status()
-        data = r.json().get("results", {}).get("options", [])
+        data = parse_json(r).get("results", {}).get("options", [])
         if not data:
             return None, None
-        option = data[0]
-        return option.get("details", {}).get("strike_price"), option.get("last_quote", {}).get("ask")
+        return select_atm_option(data)
     except Exception as e:
         logger.error(f"Polygon option error: {e}")
         return None, None
 
 # === Marketaux News ===
+# Newest `published_at` handled so far. It only advances after a scan has processed its batch, and requests
+# re-read an overlap window before it so late-indexed articles are still seen; dedup absorbs the repeats.
+last_published_at: Optional[str] = None
+MARKETAUX_CURSOR_OVERLAP = timedelta(minutes=5)
+
 def fetch_marketaux_news() -> list:
     try:
-        url = f"https://api.marketaux.com/v1/news/all?api_token={MARKETAUX_API_KEY}&language=en&filter_entities=true"
-        r = requests.get(url)
+        # Filter to monitored symbols server-side so the response holds only articles we can alert on.
+        url = (f"https://api.marketaux.com/v1/news/all?api_token={MARKETAUX_API_KEY}&language=en&filter_entities=true"
+               f"&symbols={','.join(TICKERS)}")
+        if last_published_at:
+            published_after = datetime.strptime(last_published_at, "%Y-%m-%dT%H:%M:%S") - MARKETAUX_CURSOR_OVERLAP
+            url += f"&published_after={published_after:%Y-%m-%dT%H:%M:%S}"
+        r = SESSION.get(url, timeout=HTTP_TIMEOUT)
         r.raise_for_status()
-        return r.json().get("data", [])
+        return parse_json(r).get("data", [])
     except Exception as e:
         logger.error(f"Marketaux error: {e}")
         return []
 
+def advance_marketaux_cursor(articles: list):
+    """Move the cursor to the newest `published_at` in a batch that has been fully processed."""
+    global last_published_at
+    published = [a["published_at"][:19] for a in articles if a.get("published_at")]
+    if published:
+        last_published_at = max(published + [last_published_at or ""])
+
+# === Alert Log ===
+# Append-only JSON Lines: one write per alert, no read-modify-write of the whole history.
+ALERTS_FILE = "alerts.jsonl"
+ALERTS_KEEP = 100
+alerts_file_lock = threading.Lock()
+
+def append_alert(alert: dict):
+    try:
+        with alerts_file_lock, open(ALERTS_FILE, "ab") as f:
+            f.write(orjson.dumps(alert) + b"\n")
+    except (IOError, OSError) as e:
+        logger.error(f"Error writing to {ALERTS_FILE}: {e}")
+
+def _parse_alert_lines(lines) -> list:
+    """Decode JSON lines, skipping (and logging) blank, truncated or corrupt ones."""
+    alerts = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            alerts.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            logger.warning(f"Skipping corrupt line in {ALERTS_FILE}: {line[:80]!r}")
+    return alerts
+
+def load_recent_alerts(limit: int = ALERTS_KEEP) -> list:
+    """Return the last `limit` alerts, oldest first. Raises FileNotFoundError if nothing was logged yet."""
+    with open(ALERTS_FILE, "rb") as f:
+        lines = deque(f, maxlen=limit)
+    return _parse_alert_lines(lines)
+
+def compact_alerts_log():
+    """Trim the log to the most recent ALERTS_KEEP valid entries, dropping corrupt lines."""
+    with alerts_file_lock:
+        try:
+            with open(ALERTS_FILE, "rb") as f:
+                lines = deque(f, maxlen=ALERTS_KEEP)
+        except FileNotFoundError:
+            return
+        alerts = _parse_alert_lines(lines)
+        tmp_path = f"{ALERTS_FILE}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.writelines(orjson.dumps(alert) + b"\n" for alert in alerts)
+            os.replace(tmp_path, ALERTS_FILE)
+        except (IOError, OSError) as e:
+            logger.error(f"Error compacting {ALERTS_FILE}: {e}")
+
+# === Market Data Prefetch ===
+def prefetch_market_data(tickers: list) -> dict:
+    """Fetch Polygon option and price data for `tickers` in one parallel wave.
+
+    Returns {ticker: (strike, option_price, last_price)}, failed lookups included as None.
+    """
+    futures = {ticker: (EXECUTOR.submit(get_option_data_polygon, ticker), EXECUTOR.submit(get_price_polygon, ticker))
+               for ticker in dict.fromkeys(tickers)}
+    return {ticker: (*option_future.result(), price_future.result())
+            for ticker, (option_future, price_future) in futures.items()}
+
 # === Main Scanner ===
+# Only the lead of each article is matched and scored; tickers and tone are set by the headline.
+CONTENT_MAX_CHARS = 512
+# Built once; each alert only fills in the fields.
+ALERT_TEMPLATE = (
+    "🚨 *Trade Alert: {ticker}*\n"
+    "📰 {headline}\n"
+    "📅 {timestamp} UTC\n"
+    "\n"
+    "*Market Price:* ${last_price:.2f}\n"
+    "*Option Strike:* ${strike:.2f}\n"
+    "*Ask Price:* ${option_price:.2f}\n"
+    "*Sentiment Score:* {compound:+.2f}\n"
+    "*Source:* Marketaux"
+)
+
 def scan_and_alert():
     logger.info("🔍 Starting news scan...")
     articles = fetch_marketaux_news()
+    # Bind hot globals/attributes to locals once; the loop body then uses fast local lookups.
+    polarity_scores = analyzer.polarity_scores
+    threshold = SENTIMENT_THRESHOLD
+    max_chars = CONTENT_MAX_CHARS
+    is_duplicate = is_duplicate_and_mark
+    fingerprint = article_fingerprint
+    find_tickers = match_tickers
+    scan_time = datetime.utcnow()
+    alert_timestamp = scan_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    message_timestamp = scan_time.strftime('%Y-%m-%d %H:%M:%S')
+    candidates = []
+    messages = []
     for article in articles:
-        content = f"{article.get('title', '')} {article.get('description', '')}"
+        content = f"{article.get('title') or ''} {article.get('description') or ''}".strip()[:max_chars]
         if not content:
             continue
-        h = hash(content)
-        if h in sent_hashes:
+        # Cheapest filter first: articles without a monitored ticker never take a dedup slot or a VADER pass.
+        tickers = find_tickers(content)
+        if not tickers:
+            continue
+        if is_duplicate(fingerprint(article)):
+            continue
+        compound = polarity_scores(content)['compound']
+        if abs(compound) < threshold:
             continue
-        sent_hashes.append(h)
-
-        for ticker in TICKERS:
-            if ticker in content:
-                sentiment = analyzer.polarity_scores(content)
-                compound = sentiment['compound']
-                if abs(compound) < SENTIMENT_THRESHOLD:
-                    continue
-
-                strike, option_price = get_option_data_polygon(ticker)
-                last_price = get_price_polygon(ticker)
-
-                if strike is None or option_price is None or last_price is None:
-                    logger.warning(f"Skipping {ticker} due to missing data.")
-                    continue
-
-                alert = {
-                    "ticker": ticker,
-                    "headline": article.get('title'),
-                    "sentiment": round(compound, 3),
-                    "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                }
-
-                try:
-                    with open("alerts.json", "r") as f:
-                        existing = json.load(f)
-                except FileNotFoundError:
-                    existing = []
-                    logger.info("alerts.json not found, starting with an empty list.")
-                except json.JSONDecodeError:
-                    logger.error("Error decoding alerts.json, starting with an empty list.")
-                    existing = []
-
-                existing.append(alert)
-                try:
-                    with open("alerts.json", "w") as f:
-                        json.dump(existing[-100:], f, indent=2)
-                except (IOError, OSError) as e:
-                    logger.error(f"Error writing to alerts.json: {e}")
-
-                msg = f"""
-🚨 *Trade Alert: {ticker}*
-📰 {article.get('title')}
-📅 {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC
-
-*Market Price:* ${last_price:.2f}
-*Option Strike:* ${strike:.2f}
-*Ask Price:* ${option_price:.2f}
-*Sentiment Score:* {compound:+.2f}
-*Source:* Marketaux
-                """
-                send_telegram_alert(msg)
-                break
+        candidates.append((article, tickers, compound))
+
+    # Each wave fetches, in parallel, the next ticker every pending article still needs: most alert on their
+    # first mention, and only articles whose ticker lacked data move on to their next one in a later wave.
+    # Results (failures too) are kept for the scan, so no ticker is fetched twice.
+    market_data = {}
+    pending = candidates
+    while pending:
+        market_data.update(prefetch_market_data(
+            [tickers[0] for _, tickers, _ in pending if tickers[0] not in market_data]))
+        retry_next = []
+        for article, tickers, compound in pending:
+            ticker = tickers[0]
+            strike, option_price, last_price = market_data[ticker]
+
+            if strike is None or option_price is None or last_price is None:
+                logger.warning(f"Skipping {ticker} due to missing data.")
+                if len(tickers) > 1:
+                    retry_next.append((article, tickers[1:], compound))
+                continue
+
+            alert = {
+                "ticker": ticker,
+                "headline": article.get('title'),
+                "sentiment": round(compound, 3),
+                "timestamp": alert_timestamp,
+            }
+            append_alert(alert)
+
+            messages.append(ALERT_TEMPLATE.format_map({
+                "ticker": ticker,
+                "headline": escape_markdown(article.get('title') or ''),
+                "timestamp": message_timestamp,
+                "last_price": last_price,
+                "strike": strike,
+                "option_price": option_price,
+                "compound": compound,
+            }))
+        pending = retry_next
+
+    # One Telegram message per chat for the whole scan instead of one per alert.
+    for batch in batch_messages(messages):
+        queue_telegram_alert(batch)
+    advance_marketaux_cursor(articles)
 
 # === Flask Routes ===
 @app.route("/")
@@ -176,37 +495,37 @@ def test_alert():
 @app.route("/alerts")
 def get_alerts():
     try:
-        with open("alerts.json", "r") as f:
-            alerts = json.load(f)
-        return jsonify(alerts)
+        return jsonify(load_recent_alerts())
     except FileNotFoundError:
-        logger.info("alerts.json not found in get_alerts.")
+        logger.info(f"{ALERTS_FILE} not found in get_alerts.")
         return jsonify({"error": "No alerts found."}), 404
-    except json.JSONDecodeError:
-        logger.error("Error decoding alerts.json in get_alerts.")
-        return jsonify({"error": "Error reading alerts data."}), 500
 
 @app.route("/trigger_scan")
 def trigger_scan():
-    scan_and_alert()
-    return jsonify({"result": "Scan triggered manually."})
+    try:
+        scheduler.modify_job(SCAN_JOB_ID, next_run_time=datetime.now())
+    except JobLookupError:
+        return jsonify({"error": "Scheduler not running."}), 503
+    return jsonify({"result": "Scan queued; skipped if a scan is already running."}), 202
 
 @app.route("/dashboard")
 def dashboard():
     try:
-        with open("alerts.json", "r") as f:
-            alerts = json.load(f)
-    except:
+        alerts = load_recent_alerts()
+    except (IOError, OSError):
         alerts = []
     return render_template("dashboard.html", alerts=alerts, tickers=TICKERS, time=time)
 
 # === Launch App ===
 def main():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(scan_and_alert, 'interval', minutes=SCAN_INTERVAL_MINUTES)
+    # First scan runs right away on the scheduler thread, so waitress can bind the port without waiting for it.
+    scheduler.add_job(scan_and_alert, 'interval', id=SCAN_JOB_ID, minutes=SCAN_INTERVAL_MINUTES, max_instances=1,
+                      coalesce=True, next_run_time=datetime.now())
+    # Compact at startup too: frequent restarts could otherwise keep the daily run from ever firing.
+    scheduler.add_job(compact_alerts_log, 'interval', hours=24, next_run_time=datetime.now())
+    threading.Thread(target=telegram_sender_loop, name="telegram-sender", daemon=True).start()
     scheduler.start()
     logger.info("📆 Scheduler started.")
-    scan_and_alert()
     from waitress import serve
     serve(app, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
 
@@ -1,13 +1,16 @@
 import unittest
 import json
-from unittest.mock import patch, mock_open
+import requests
+from unittest.mock import Mock, patch, mock_open
 import os
 import sys
+import tempfile
 
 # Add parent directory to path to import main
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from main import app, send_telegram_alert, analyzer, scan_and_alert, sent_hashes as main_global_sent_hashes # Assuming 'analyzer' is accessible for testing sentiment
+import main
+from main import app, send_telegram_alert, analyzer, scan_and_alert, fetch_marketaux_news, match_tickers, article_fingerprint, is_duplicate_and_mark, get_option_data_polygon, select_atm_option, sent_hashes as main_global_sent_hashes # Assuming 'analyzer' is accessible for testing sentiment
 # If main.py needs to be loadable as a module without running main() immediately,
 # ensure the main execution block is guarded by if __name__ == '__main__': (which it is)
 
@@ -19,7 +22,7 @@ class TestMainApp(unittest.TestCase):
         # We will patch main.TELEGRAM_BOT_TOKEN and main.TELEGRAM_CHAT_IDS directly in tests
 
 
-    @patch('main.requests.post')
+    @patch('main.SESSION.post')
     @patch('main.TELEGRAM_CHAT_IDS', ['12345'])
     @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
     def test_send_telegram_alert_success(self, mock_post):
@@ -31,21 +34,77 @@ class TestMainApp(unittest.TestCase):
         self.assertEqual(kwargs['data']['text'], "Test message")
         self.assertEqual(kwargs['data']['chat_id'], "12345")
 
-    @patch('main.requests.post')
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111', ' 222'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_fans_out_to_all_chats(self, mock_post):
+        mock_post.return_value.raise_for_status = lambda: None
+        send_telegram_alert("Fan-out message")
+        self.assertEqual(mock_post.call_count, 2)
+        chat_ids = sorted(call.kwargs['data']['chat_id'] for call in mock_post.call_args_list)
+        self.assertEqual(chat_ids, ['111', '222'])
+
+    @patch('main._post_telegram_message.retry.sleep', lambda seconds: None)
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111', '222'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_retries_only_failing_chat(self, mock_post):
+        def post(url, data, **kwargs):
+            response = Mock()
+            if data['chat_id'] == '222' and post.failures < 2:
+                post.failures += 1
+                error_response = Mock(status_code=502)
+                response.raise_for_status.side_effect = requests.HTTPError(response=error_response)
+            return response
+        post.failures = 0
+        mock_post.side_effect = post
+        send_telegram_alert("Retry message")
+        chat_ids = [call.kwargs['data']['chat_id'] for call in mock_post.call_args_list]
+        self.assertEqual(chat_ids.count('111'), 1)
+        self.assertEqual(chat_ids.count('222'), 3)
+
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_does_not_retry_client_errors(self, mock_post):
+        error_response = Mock(status_code=400)
+        mock_post.return_value.raise_for_status.side_effect = requests.HTTPError(response=error_response)
+        send_telegram_alert("Bad request")
+        mock_post.assert_called_once()
+
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111', '222', '333'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_logs_every_failing_chat(self, mock_post):
+        def post(url, data, **kwargs):
+            response = Mock()
+            if data['chat_id'] != '222':
+                response.raise_for_status.side_effect = requests.HTTPError(response=Mock(status_code=400))
+            return response
+        mock_post.side_effect = post
+        with self.assertLogs(main.logger) as logs:
+            send_telegram_alert("Bad request")
+        errors = [line for line in logs.output if line.startswith('ERROR')]
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(any('111' in line for line in errors))
+        self.assertTrue(any('333' in line for line in errors))
+        self.assertTrue(any('INFO' in line and '222' in line for line in logs.output))
+
+    @patch('main.SESSION.post')
     @patch('main.TELEGRAM_CHAT_IDS', [])
     @patch('main.TELEGRAM_BOT_TOKEN', None)
     def test_send_telegram_alert_no_config_token_none(self, mock_post):
         send_telegram_alert("Test message no config")
         mock_post.assert_not_called()
 
-    @patch('main.requests.post')
+    @patch('main.SESSION.post')
     @patch('main.TELEGRAM_CHAT_IDS', [])
     @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
     def test_send_telegram_alert_no_config_chat_ids_empty(self, mock_post):
         send_telegram_alert("Test message no config")
         mock_post.assert_not_called()
 
-    @patch('main.requests.post')
+    @patch('main.SESSION.post')
     @patch('main.TELEGRAM_CHAT_IDS', ['12345'])
     @patch('main.TELEGRAM_BOT_TOKEN', None)
     def test_send_telegram_alert_no_config_token_none_with_ids(self, mock_post):
@@ -66,6 +125,36 @@ class TestMainApp(unittest.TestCase):
         sentiment = analyzer.polarity_scores(text)
         self.assertTrue(sentiment['compound'] < 0)
 
+    @patch('main.queue_telegram_alert')
+    @patch('main.append_alert')
+    @patch('main.get_price_polygon', return_value=300.0)
+    @patch('main.get_option_data_polygon')
+    @patch('main.fetch_marketaux_news')
+    def test_scan_falls_back_to_next_ticker_in_second_wave(self, mock_fetch_news, mock_get_option, mock_get_price, mock_append, mock_queue):
+        main_global_sent_hashes.clear()
+        mock_fetch_news.return_value = [
+            {'title': 'SMCI and NVDA soar on great results'},
+            {'title': 'SMCI and AMD soar on great results'},
+        ]
+        mock_get_option.side_effect = lambda ticker: (None, None) if ticker == 'SMCI' else (100.0, 2.0)
+        with patch('main.TICKERS', ('NVDA', 'AMD', 'SMCI')), patch('main.SENTIMENT_THRESHOLD', 0.1):
+            scan_and_alert()
+        self.assertEqual(sorted(c.args[0]['ticker'] for c in mock_append.call_args_list), ['AMD', 'NVDA'])
+        self.assertEqual(sorted(c.args[0] for c in mock_get_option.call_args_list), ['AMD', 'NVDA', 'SMCI'])
+
+    @patch('main.queue_telegram_alert')
+    @patch('main.append_alert')
+    @patch('main.get_price_polygon', return_value=300.0)
+    @patch('main.get_option_data_polygon', return_value=(300.0, 5.0))
+    @patch('main.fetch_marketaux_news')
+    def test_scan_keeps_emoji_run_sentiment(self, mock_fetch_news, mock_get_option, mock_get_price, mock_append, mock_queue):
+        main_global_sent_hashes.clear()
+        mock_fetch_news.return_value = [{'title': 'NVDA earnings 😀😀😀😀'}]
+        with patch('main.TICKERS', ('NVDA',)), patch('main.SENTIMENT_THRESHOLD', 0.6):
+            scan_and_alert()
+        mock_append.assert_called_once()
+        self.assertGreater(mock_append.call_args[0][0]['sentiment'], 0.8)
+
     def test_health_route(self):
         response = self.app.get('/health')
         self.assertEqual(response.status_code, 200)
@@ -73,7 +162,7 @@ class TestMainApp(unittest.TestCase):
         self.assertEqual(data['status'], 'healthy')
         self.assertIn('timestamp', data)
 
-    @patch('main.open', new_callable=mock_open, read_data='[{"ticker": "NVDA", "headline": "Good news", "sentiment": 0.8}]')
+    @patch('main.open', new_callable=mock_open, read_data='{"ticker": "NVDA", "headline": "Good news", "sentiment": 0.8}\n')
     def test_get_alerts_success(self, mock_file):
         response = self.app.get('/alerts')
         self.assertEqual(response.status_code, 200)
@@ -91,25 +180,41 @@ class TestMainApp(unittest.TestCase):
         self.assertEqual(data['error'], 'No alerts found.')
 
 
-    @patch('main.open', new_callable=mock_open, read_data='invalid json')
-    def test_get_alerts_json_decode_error(self, mock_file):
-        # For json.JSONDecodeError, the mock_open needs to raise it when 'load' is called.
-        # A more direct way is to patch json.load directly for this specific test.
-        with patch('main.json.load', side_effect=json.JSONDecodeError("Error", "doc", 0)):
-             response = self.app.get('/alerts')
-             self.assertEqual(response.status_code, 500) # Based on refactoring
-             data = json.loads(response.get_data(as_text=True))
-             self.assertIn('error', data)
-             self.assertEqual(data['error'], 'Error reading alerts data.')
+    @patch('main.open', new_callable=mock_open, read_data='{"ticker": "NVDA"}\ninvalid json\n{"ticker": "TSLA"\n')
+    def test_get_alerts_skips_corrupt_lines(self, mock_file):
+        response = self.app.get('/alerts')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.get_data(as_text=True))
+        self.assertEqual(data, [{'ticker': 'NVDA'}])
+
+    def test_compact_alerts_log_keeps_most_recent(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'alerts.jsonl')
+            with patch('main.ALERTS_FILE', path), patch('main.ALERTS_KEEP', 2):
+                for i in range(3):
+                    main.append_alert({'ticker': f'T{i}'})
+                main.compact_alerts_log()
+                self.assertEqual([a['ticker'] for a in main.load_recent_alerts()], ['T1', 'T2'])
+
+    def test_compact_alerts_log_drops_corrupt_lines(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'alerts.jsonl')
+            with patch('main.ALERTS_FILE', path):
+                main.append_alert({'ticker': 'T0'})
+                with open(path, 'ab') as f:
+                    f.write(b'{"ticker": "T1')
+                main.compact_alerts_log()
+                main.append_alert({'ticker': 'T2'})
+                with open(path, 'rb') as f:
+                    self.assertEqual(f.read(), b'{"ticker":"T0"}\n{"ticker":"T2"}\n')
 
-    @patch('main.send_telegram_alert')
+    @patch('main.queue_telegram_alert')
     @patch('main.get_price_polygon')
     @patch('main.get_option_data_polygon')
     @patch('main.fetch_marketaux_news')
     @patch('main.analyzer.polarity_scores') # New patch
     @patch('main.open', new_callable=mock_open)
-    @patch('main.json.dump') # To verify what's being written
-    def test_scan_and_alert_integration(self, mock_json_dump, mock_file_open, mock_polarity_scores, mock_fetch_news, mock_get_option, mock_get_price, mock_send_alert):
+    def test_scan_and_alert_integration(self, mock_file_open, mock_polarity_scores, mock_fetch_news, mock_get_option, mock_get_price, mock_send_alert):
         # --- Setup Mocks ---
         main_global_sent_hashes.clear() # Clear the global deque before each run of this test
         mock_polarity_scores.return_value = {'compound': 0.95} # Ensure high sentiment
@@ -136,16 +241,11 @@ class TestMainApp(unittest.TestCase):
         mock_get_price.return_value = 300.0  # Mock stock price for NVDA
         mock_get_option.return_value = (290.0, 5.5)  # Mock strike_price, ask_price
 
-        # 3. Mock 'open' for reading alerts.json (initially empty)
-        # The mock_open by default will handle read. For json.load, we need to ensure it returns a valid list.
-        mock_file_open.side_effect = [
-            mock_open(read_data='[]').return_value,  # For initial read of alerts.json
-            mock_open().return_value  # For writing alerts.json
-        ]
-        
+        # 3. 'open' is mocked so the alert is appended to a fake alerts.jsonl
+
         # --- Execute Function ---
         # Make sure TICKERS includes 'NVDA' and set a testable SENTIMENT_THRESHOLD
-        with patch('main.TICKERS', ['NVDA', 'TSLA']): # Ensure NVDA is in the list for the test
+        with patch('main.TICKERS', ['NVDA', 'TSLA']), patch('main.last_published_at', None): # Ensure NVDA is in the list for the test
             # SENTIMENT_THRESHOLD will be effectively bypassed by mocking polarity_scores directly above SENTIMENT_THRESHOLD
             # but we keep it patched to a low value for consistency if the mock above was removed.
             with patch('main.SENTIMENT_THRESHOLD', 0.1): 
@@ -168,18 +268,166 @@ class TestMainApp(unittest.TestCase):
         self.assertIn("$290.00", alert_message_args) # Option Strike
         self.assertIn("$5.50", alert_message_args)   # Ask Price
 
-        # 4. Check if alerts.json was written to
-        # mock_file_open should have been called twice (read, then write)
-        self.assertEqual(mock_file_open.call_count, 2)
-
-        # Check the content written by json.dump
-        mock_json_dump.assert_called_once()
-        written_data_args = mock_json_dump.call_args[0][0] # First arg of json.dump
-        self.assertEqual(len(written_data_args), 1)
-        self.assertEqual(written_data_args[0]['ticker'], 'NVDA')
-        self.assertEqual(written_data_args[0]['headline'], 'EXTREMELY POSITIVE NEWS for NVDA!')
+        # 4. Check that one line was appended to alerts.jsonl (no read of the existing log)
+        mock_file_open.assert_called_once_with('alerts.jsonl', 'ab')
+        handle = mock_file_open()
+        handle.write.assert_called_once()
+        written = handle.write.call_args[0][0]
+        self.assertTrue(written.endswith(b'\n'))
+        written_alert = json.loads(written)
+        self.assertEqual(written_alert['ticker'], 'NVDA')
+        self.assertEqual(written_alert['headline'], 'EXTREMELY POSITIVE NEWS for NVDA!')
         # The sentiment stored will be the mocked one (0.95), check against that.
-        self.assertEqual(written_data_args[0]['sentiment'], 0.95)
+        self.assertEqual(written_alert['sentiment'], 0.95)
+
+    @patch('main.SESSION.get')
+    def test_fetch_marketaux_news_requests_only_newer_articles(self, mock_get):
+        mock_get.return_value.raise_for_status = lambda: None
+        mock_get.return_value.content = json.dumps({'data': [
+            {'title': 'older', 'published_at': '2024-01-01T09:00:00.000000Z'},
+            {'title': 'newer', 'published_at': '2024-01-01T10:30:00.000000Z'},
+        ]}).encode()
+        with patch('main.last_published_at', None), patch('main.TICKERS', ['NVDA', 'TSLA']):
+            articles = fetch_marketaux_news()
+            self.assertEqual(len(articles), 2)
+            self.assertIn('symbols=NVDA,TSLA', mock_get.call_args[0][0])
+            self.assertNotIn('published_after', mock_get.call_args[0][0])
+            self.assertIsNone(main.last_published_at)  # fetching alone never moves the cursor
+
+            main.advance_marketaux_cursor(articles)
+            self.assertEqual(main.last_published_at, '2024-01-01T10:30:00')
+
+            mock_get.return_value.content = b'{"data": []}'
+            main.advance_marketaux_cursor(fetch_marketaux_news())
+            # Re-reads a 5 minute overlap so late-indexed articles are not skipped.
+            self.assertIn('published_after=2024-01-01T10:25:00', mock_get.call_args[0][0])
+            self.assertEqual(main.last_published_at, '2024-01-01T10:30:00')
+
+    @patch('main.queue_telegram_alert')
+    @patch('main.fetch_marketaux_news')
+    def test_scan_advances_cursor_after_processing(self, mock_fetch_news, mock_queue):
+        mock_fetch_news.return_value = [{'title': 'no tickers here', 'published_at': '2024-02-01T08:00:00Z'}]
+        with patch('main.last_published_at', None):
+            scan_and_alert()
+            self.assertEqual(main.last_published_at, '2024-02-01T08:00:00')
+
+    def test_match_tickers_whole_words_only(self):
+        with patch('main.TICKERS', ['BAC', 'F', 'NVDA']):
+            self.assertEqual(match_tickers("BACKBONE Financial upgrades NVDA"), ['NVDA'])
+            self.assertEqual(match_tickers("F and BAC rally; F extends gains"), ['F', 'BAC'])
+        with patch('main.TICKERS', []):
+            self.assertEqual(match_tickers("NVDA"), [])
+
+    def test_article_fingerprint_collapses_near_duplicates(self):
+        original = {'title': 'NVDA beats estimates, shares jump!', 'description': 'Reuters'}
+        mirrored = {'title': '  nvda beats  estimates shares jump', 'description': 'Yahoo Finance'}
+        other = {'title': 'NVDA misses estimates', 'description': 'Reuters'}
+        self.assertEqual(article_fingerprint(original), article_fingerprint(mirrored))
+        self.assertNotEqual(article_fingerprint(original), article_fingerprint(other))
+
+    def test_is_duplicate_and_mark_evicts_oldest(self):
+        main_global_sent_hashes.clear()
+        with patch('main.SENT_HASHES_MAX', 2):
+            self.assertFalse(is_duplicate_and_mark(1))
+            self.assertFalse(is_duplicate_and_mark(2))
+            self.assertTrue(is_duplicate_and_mark(1))
+            self.assertFalse(is_duplicate_and_mark(3))  # evicts 1
+            self.assertFalse(is_duplicate_and_mark(1))
+        main_global_sent_hashes.clear()
+
+    @patch('main.SESSION.get')
+    def test_get_option_data_polygon_is_cached(self, mock_get):
+        get_option_data_polygon.cache_clear()
+        mock_get.return_value.raise_for_status = lambda: None
+        mock_get.return_value.content = json.dumps({'results': {'options': [
+            {'details': {'strike_price': 100.0}, 'last_quote': {'ask': 2.5}},
+        ]}}).encode()
+        self.assertEqual(get_option_data_polygon('NVDA'), (100.0, 2.5))
+        self.assertEqual(get_option_data_polygon('NVDA'), (100.0, 2.5))
+        mock_get.assert_called_once()
+
+        mock_get.side_effect = Exception("boom")
+        self.assertEqual(get_option_data_polygon('TSLA'), (None, None))
+        mock_get.side_effect = None
+        self.assertEqual(get_option_data_polygon('TSLA'), (100.0, 2.5))  # failures are not cached
+        get_option_data_polygon.cache_clear()
+
+    def test_select_atm_option_picks_nearest_quoted_call(self):
+        underlying = {'price': 101.0}
+        options = [
+            {'details': {'strike_price': 90.0, 'contract_type': 'call'}, 'last_quote': {'ask': 12.0}, 'underlying_asset': underlying},
+            {'details': {'strike_price': 100.0, 'contract_type': 'put'}, 'last_quote': {'ask': 1.1}, 'underlying_asset': underlying},
+            {'details': {'strike_price': 102.0, 'contract_type': 'call'}, 'last_quote': {}, 'underlying_asset': underlying},
+            {'details': {'strike_price': 105.0, 'contract_type': 'call'}, 'last_quote': {'ask': 1.8}, 'underlying_asset': underlying},
+        ]
+        self.assertEqual(select_atm_option(options), (105.0, 1.8))
+        self.assertEqual(select_atm_option([{'details': {'strike_price': 50.0}, 'last_quote': {'ask': 3.0}}]), (50.0, 3.0))
+
+    def test_select_atm_option_without_quoted_call_returns_none(self):
+        underlying = {'price': 101.0}
+        options = [
+            {'details': {'strike_price': 100.0, 'contract_type': 'put'}, 'last_quote': {'ask': 1.0}, 'underlying_asset': underlying},
+            {'details': {'strike_price': 105.0, 'contract_type': 'call'}, 'last_quote': {}, 'underlying_asset': underlying},
+        ]
+        self.assertEqual(select_atm_option(options), (None, None))
+
+    @patch('main.scheduler.modify_job')
+    @patch('main.scan_and_alert')
+    def test_trigger_scan_reschedules_scan_job(self, mock_scan, mock_modify_job):
+        response = self.app.get('/trigger_scan')
+        self.assertEqual(response.status_code, 202)
+        mock_scan.assert_not_called()
+        mock_modify_job.assert_called_once()
+        self.assertEqual(mock_modify_job.call_args[0][0], main.SCAN_JOB_ID)
+        self.assertIn('next_run_time', mock_modify_job.call_args.kwargs)
+        self.assertIn('queued', json.loads(response.get_data(as_text=True))['result'])
+
+    def test_trigger_scan_without_scheduler_job(self):
+        response = self.app.get('/trigger_scan')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('error', json.loads(response.get_data(as_text=True)))
+
+    @patch('main.send_telegram_alert')
+    def test_send_next_queued_alert_drains_one_message(self, mock_send):
+        main.queue_telegram_alert("Queued message")
+        main.send_next_queued_alert()
+        self.assertTrue(main.telegram_queue.empty())
+        mock_send.assert_called_once_with("Queued message")
+
+    def test_batch_messages_packs_within_limit(self):
+        self.assertEqual(main.batch_messages([]), [])
+        self.assertEqual(main.batch_messages(['a', 'b']), ['a' + main.ALERT_SEPARATOR + 'b'])
+        batches = main.batch_messages(['x' * 6, 'y' * 6, 'z' * 6], limit=20)
+        self.assertEqual(batches, ['x' * 6 + main.ALERT_SEPARATOR + 'y' * 6, 'z' * 6])
+        self.assertEqual(main.batch_messages(['a', 'w' * 30], limit=20), ['a', 'w' * 20])
+
+    @patch('main._post_telegram_message.retry.sleep')
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_honours_retry_after(self, mock_post, mock_sleep):
+        throttled = Mock()
+        throttled.raise_for_status.side_effect = requests.HTTPError(
+            response=Mock(status_code=429, headers={'Retry-After': '7'}))
+        mock_post.side_effect = [throttled, Mock()]
+        send_telegram_alert("Throttled message")
+        self.assertEqual(mock_post.call_count, 2)
+        mock_sleep.assert_called_once_with(7.0)
+
+    @patch('main._post_telegram_message.retry.sleep')
+    @patch('main.SESSION.post')
+    @patch('main.TELEGRAM_CHAT_IDS', ['111'])
+    @patch('main.TELEGRAM_BOT_TOKEN', 'test_token')
+    def test_send_telegram_alert_caps_retry_after(self, mock_post, mock_sleep):
+        throttled = Mock()
+        throttled.raise_for_status.side_effect = requests.HTTPError(
+            response=Mock(status_code=429, headers={'Retry-After': '3600'}))
+        mock_post.side_effect = [throttled, Mock()]
+        send_telegram_alert("Throttled message")
+        mock_sleep.assert_called_once_with(float(main.TELEGRAM_RETRY_AFTER_MAX))
+
+    def test_escape_markdown_neutralises_entities(self):
+        self.assertEqual(main.escape_markdown("AT&T_Q1 *beat* [x] `y`"), r"AT&T\_Q1 \*beat\* \[x] \`y\`")
 
 if __name__ == '__main__':
     unittest.main()